@@ -1,13 +1,70 @@
 '''
 Flask Application
 '''
-from flask import Flask, jsonify, request
+import json
+import math
+import os
+import time
+
+from flask import Flask, Response, jsonify, request
+from changes import ChangeFeed
+from limits import RateLimiter, WorkQueue
 from models import Experience, Education, Skill
-from utils import load_data, save_data, generate_id, correct_spelling
+from utils import load_data, save_data, generate_id, correct_spelling_until
+from validation import validators
 
 data = load_data('data/data.json')
+changes = ChangeFeed()
+
+
+def load_limits(config):
+    '''
+    Overrides the SPELLING_* and CHANGES_* defaults with FLASK_<NAME>
+    environment variables, e.g. FLASK_SPELLING_RATE=5
+    '''
+    for name in [name for name in config if name.startswith(('SPELLING_', 'CHANGES_'))]:
+        value = os.environ.get(f'FLASK_{name}')
+        if value is None:
+            continue
+        try:
+            config[name] = json.loads(value)
+        except ValueError:
+            config[name] = value
+
+
+def positive_limit(config, name):
+    '''
+    Returns the named limit, raising ValueError if it is not a positive number
+    '''
+    value = config[name]
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        raise ValueError(f"{name} must be a positive number, got {value!r}")
+    return value
+
 
 app = Flask(__name__)
+app.config.update(
+    SPELLING_MAX_TEXT_LENGTH=5000,
+    SPELLING_MAX_WORDS=500,
+    SPELLING_MAX_WORD_LENGTH=30,
+    SPELLING_LONG_WORD_LENGTH=6,    # longer words are only corrected up to edit distance 1
+    SPELLING_TIME_BUDGET=1,         # seconds of spelling work per request
+    SPELLING_RATE=2,                # requests per second per client
+    SPELLING_BURST=10,
+    SPELLING_WORKERS=2,             # spelling requests processed at once
+    SPELLING_QUEUE_SIZE=8,          # spelling requests waiting for a worker
+    SPELLING_QUEUE_TIMEOUT=2,       # seconds a request may wait for a worker
+    CHANGES_MAX_STREAMS=16,         # change streams open at once, each holds a thread
+    CHANGES_STREAM_LIFETIME=300,    # seconds before a stream ends and the client reconnects
+)
+load_limits(app.config)
+
+spelling_limiter = RateLimiter(positive_limit(app.config, 'SPELLING_RATE'),
+                               positive_limit(app.config, 'SPELLING_BURST'))
+spelling_queue = WorkQueue(positive_limit(app.config, 'SPELLING_WORKERS'),
+                           app.config['SPELLING_QUEUE_SIZE'],
+                           app.config['SPELLING_QUEUE_TIMEOUT'])
+change_streams = WorkQueue(positive_limit(app.config, 'CHANGES_MAX_STREAMS'), 0, 0)
 
 @app.route('/test')
 def hello_world():
@@ -38,22 +95,21 @@ def experience():
         return jsonify([edu.__dict__ for edu in data['experience']])
 
     if request.method == "POST":
-        required_fields = ['title', 'company', 'start_date', 'end_date', 'description', 'logo']
-
-        if not request.json:
+        new_experience_data = request.get_json(silent=True)
+        if not new_experience_data:
             return jsonify({'error': 'No data provided'}), 400
 
-        missing_fields = [field for field in required_fields if field not in request.json]
-        if missing_fields:
-            return jsonify({'error': 'Missing required fields'}), 400
+        error = validators['experience'](new_experience_data)
+        if error:
+            return jsonify({'error': error}), 400
 
         new_id = generate_id(data, 'experience')
-        new_experience_data = request.json
         new_experience_data['id'] = new_id
         new_experience = Experience(**new_experience_data)
 
         data['experience'].append(new_experience)
         save_data('data/data.json', data)
+        changes.record('experience', 'create', new_id, new_experience)
 
         return jsonify({'id': new_id}), 201
     
@@ -68,11 +124,20 @@ def experience():
         if not (0 < index <= len(data["experience"])):
             return jsonify({"error": 'Index not in range'}), 400
         
-        updated_experience_data = request.json
-        updated_experience_data['id'] = index
+        updated_experience_data = request.get_json(silent=True)
+        if not updated_experience_data:
+            return jsonify({'error': 'No data provided'}), 400
+
+        error = validators['experience'](updated_experience_data)
+        if error:
+            return jsonify({'error': error}), 400
+
+        # keep the id of the replaced item so it stays the same item in the change feed
+        updated_experience_data['id'] = data["experience"][index - 1].id
         updated_experience = Experience(**updated_experience_data)
         data["experience"][index - 1] = updated_experience
         save_data('data/data.json', data)
+        changes.record('experience', 'update', updated_experience.id, updated_experience)
         return jsonify(data["experience"][index - 1]), 200
     
     if request.method == 'DELETE':
@@ -84,8 +149,9 @@ def experience():
             
             if 0 < int(index) <= len(data["experience"]):
                 # ids in data.json are 1 indexed
-                data["experience"].pop(int(index)-1)
+                deleted = data["experience"].pop(int(index)-1)
                 save_data('data/data.json', data)
+                changes.record('experience', 'delete', deleted.id)
                 return jsonify({"message": "Successfully deleted"}), 200
 
         return jsonify({"error": 'Invalid Index'}), 400
@@ -112,23 +178,22 @@ def education():
         return jsonify(data.get("education")), 200 #return the whole list
 
     if request.method == 'POST':
-        required_fields = ['course', 'school', 'start_date', 'end_date', 'grade', 'logo']
-        if not request.json:
+        new_education_data = request.get_json(silent=True)
+        if not new_education_data:
             return jsonify({'error': 'No data provided'}), 400
 
-        missing_fields = [field for field in required_fields if field not in request.json]
-        if missing_fields:
-            return jsonify({'error': 'Missing required fields'}), 400
+        error = validators['education'](new_education_data)
+        if error:
+            return jsonify({'error': error}), 400
 
         # If we used database, it will generate the id for us
         new_id = generate_id(data, 'education')
-
-        new_education_data = request.json
         new_education_data['id'] = new_id
         new_education = Education(**new_education_data)
 
         data['education'].append(new_education)
         save_data('data/data.json', data)
+        changes.record('education', 'create', new_id, new_education)
 
         return jsonify({'id': new_id}), 201
     
@@ -141,8 +206,9 @@ def education():
             
             if 0 < int(index) <= len(data["education"]):
                 # ids in data.json are 1 indexed
-                data["education"].pop(int(index)-1)
+                deleted = data["education"].pop(int(index)-1)
                 save_data('data/data.json', data)
+                changes.record('education', 'delete', deleted.id)
                 return jsonify({"message": "Successfully deleted"}), 200
 
         return jsonify({"error": 'Invalid Index'}), 400
@@ -159,11 +225,20 @@ def education():
         index = int(index)
         if not 0 < index <= len(data["education"]):
             return jsonify({"error": 'Index not in range'}), 400
-        updated_education_data = request.json
-        updated_education_data['id'] = index
+        updated_education_data = request.get_json(silent=True)
+        if not updated_education_data:
+            return jsonify({'error': 'No data provided'}), 400
+
+        error = validators['education'](updated_education_data)
+        if error:
+            return jsonify({'error': error}), 400
+
+        # keep the id of the replaced item so it stays the same item in the change feed
+        updated_education_data['id'] = data["education"][index - 1].id
         updated_education = Education(**updated_education_data)
         data["education"][index - 1] = updated_education
         save_data('data/data.json', data)
+        changes.record('education', 'update', updated_education.id, updated_education)
         return jsonify(data["education"][index - 1]), 200
     return jsonify({'error': 'Method not allowed'}), 405
 
@@ -187,20 +262,20 @@ def skill():
         return jsonify(data.get("skill")), 200 #return the whole list
 
     if request.method == 'POST':
-        required_fields = ['name', 'proficiency', 'logo']
-        if not request.json:
+        new_skill_data = request.get_json(silent=True)
+        if not new_skill_data:
             return jsonify({'error': 'No data provided'}), 400
 
-        missing_fields = [field for field in required_fields if field not in request.json]
-        if missing_fields:
-            return jsonify({'error': 'Missing required fields'}), 400
+        error = validators['skill'](new_skill_data)
+        if error:
+            return jsonify({'error': error}), 400
 
         new_id = generate_id(data, 'skill')
-        new_skill_data = request.json
         new_skill_data['id'] = new_id
         new_skill = Skill(**new_skill_data)
         data["skill"].append(new_skill)
         save_data('data/data.json', data)
+        changes.record('skill', 'create', new_id, new_skill)
 
         return jsonify({'id': new_id}), 201
 
@@ -214,8 +289,9 @@ def skill():
             if int(index) < 0 or int(index) >= len(data.get("skill")):
                 return jsonify("Incorrect request, index out of bounds"), 400
 
-            data.get("skill").pop(int(index))
+            deleted = data.get("skill").pop(int(index))
             save_data('data/data.json', data)
+            changes.record('skill', 'delete', deleted.id)
             return jsonify({"message": "Successfully deleted"}), 200
 
         return jsonify({"error": 'Invalid request'}), 400
@@ -231,23 +307,145 @@ def skill():
         if not 0 < index <= len(data["skill"]):
             return jsonify({"error": 'Index not in range'}), 400
         
-        updated_skill_data = request.json
-        updated_skill_data['id'] = index
+        updated_skill_data = request.get_json(silent=True)
+        if not updated_skill_data:
+            return jsonify({'error': 'No data provided'}), 400
+
+        error = validators['skill'](updated_skill_data)
+        if error:
+            return jsonify({'error': error}), 400
+
+        # keep the id of the replaced item so it stays the same item in the change feed
+        updated_skill_data['id'] = data["skill"][index].id
         updated_skill = Skill(**updated_skill_data)
         data["skill"][index] = updated_skill
         save_data('data/data.json', data)
+        changes.record('skill', 'update', updated_skill.id, updated_skill)
         return jsonify(data["skill"][index]), 200
     return jsonify({})
 
 
+@app.route('/resume/changes', methods=['GET'])
+def resume_changes():
+    '''
+    Returns the changes made after the cursor given by `since`,
+    or all changes kept by the feed if no cursor is given
+    '''
+    since = request.args.get("since")
+    if since is None:
+        revision, delta = changes.retained()
+        return jsonify({"epoch": changes.epoch, "revision": revision,
+                        "cursor": changes.cursor(revision), "changes": delta}), 200
+
+    try:
+        revision = changes.parse_cursor(since)
+    except ValueError:
+        return jsonify({"error": "Since must be a cursor returned by the feed"}), 400
+
+    delta = changes.since(revision)
+    if delta is None:
+        # the feed no longer covers that revision, client has to re-fetch
+        return jsonify({"error": "Revision expired", "epoch": changes.epoch,
+                        "revision": changes.revision, "cursor": changes.cursor()}), 410
+
+    revision = delta[-1]["revision"] if delta else revision
+    return jsonify({"epoch": changes.epoch, "revision": revision,
+                    "cursor": changes.cursor(revision), "changes": delta}), 200
+
+
+@app.route('/resume/changes/stream', methods=['GET'])
+def resume_changes_stream():
+    '''
+    Streams changes as server-sent events, starting after the cursor
+    given by `since` or the Last-Event-ID header of a reconnecting client.
+    Streams end after CHANGES_STREAM_LIFETIME, clients reconnect from their last event
+    '''
+    since = request.headers.get("Last-Event-ID", request.args.get("since"))
+    if since is None:
+        since = changes.cursor()
+    try:
+        revision = changes.parse_cursor(since)
+    except ValueError:
+        return jsonify({"error": "Since must be a cursor returned by the feed"}), 400
+
+    lifetime = app.config['CHANGES_STREAM_LIFETIME']
+    if not change_streams.acquire():
+        return jsonify({"error": "Too many open streams"}), 503, \
+            {"Retry-After": str(math.ceil(lifetime))}
+
+    def stream(revision):
+        end = time.monotonic() + lifetime
+        while time.monotonic() < end:
+            delta = changes.wait(revision, timeout=min(15, end - time.monotonic()))
+            if delta is None:
+                revision = changes.revision
+                reset = {"epoch": changes.epoch, "revision": revision}
+                yield (f"id: {changes.cursor(revision)}\nevent: reset\n"
+                       f"data: {json.dumps(reset)}\n\n")
+                continue
+            if not delta:
+                # keep idle connections from being dropped by proxies
+                yield ": keep-alive\n\n"
+                continue
+            for change in delta:
+                revision = change["revision"]
+                yield (f"id: {changes.cursor(revision)}\nevent: change\n"
+                       f"data: {json.dumps(change)}\n\n")
+
+    response = Response(stream(revision), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache'})
+    # the stream slot is freed when the client disconnects or the stream ends
+    response.call_on_close(change_streams.release)
+    return response
+
+
+def spelling_input_error(body):
+    '''
+    Checks the spelling request body against the size limits.
+    Returns an error response, or None if the text can be corrected
+    '''
+    if not isinstance(body, dict) or not isinstance(body.get('text', ''), str):
+        return jsonify({"error": "Text must be a string"}), 400
+
+    text = body.get('text', '')
+    if len(text) > app.config['SPELLING_MAX_TEXT_LENGTH']:
+        return jsonify({"error": "Text too long"}), 413
+    words = text.split()
+    if len(words) > app.config['SPELLING_MAX_WORDS']:
+        return jsonify({"error": "Too many words"}), 413
+    if any(len(word) > app.config['SPELLING_MAX_WORD_LENGTH'] for word in words):
+        return jsonify({"error": "Word too long"}), 413
+    return None
+
+
 @app.route('/spelling/correct-spelling', methods=['GET', 'POST'])
 def spelling_check():
     '''
     Handles spelling check requests
     '''
-    data = request.get_json()
-    text = data.get('text', '')
-    corrected_text = correct_spelling(text)
-
-    # return the original and corrected text
-    return jsonify({"before": text, "after": corrected_text})
+    retry_after = spelling_limiter.acquire(request.remote_addr)
+    if retry_after:
+        return jsonify({"error": "Too many requests"}), 429, \
+            {"Retry-After": str(math.ceil(retry_after))}
+
+    body = request.get_json(silent=True)
+    error = spelling_input_error(body)
+    if error:
+        return error
+
+    budget = app.config['SPELLING_TIME_BUDGET']
+    if not spelling_queue.acquire():
+        # shed load so the resume routes are not starved of workers,
+        # the queue drains within one time budget per round of workers
+        rounds = (spelling_queue.max_waiting + spelling_queue.workers) / spelling_queue.workers
+        return jsonify({"error": "Spelling service busy"}), 503, \
+            {"Retry-After": str(math.ceil(budget * rounds))}
+    text = body.get('text', '')
+    try:
+        corrected_text, truncated = correct_spelling_until(
+            text, time.monotonic() + budget, app.config['SPELLING_LONG_WORD_LENGTH'])
+    finally:
+        spelling_queue.release()
+
+    # return the original and corrected text, truncated if the time budget ran out
+    return jsonify({"before": text, "after": corrected_text, "truncated": truncated})
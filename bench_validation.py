@@ -0,0 +1,69 @@
+'''
+Benchmark for per-request validation cost.
+
+Compares the compiled validator against the same checks rebuilt from the
+model's fields on every request, and against the old required-only check
+the handlers used to do. Run with:
+
+    python bench_validation.py
+'''
+import timeit
+from dataclasses import fields
+
+from models import Experience
+from validation import GENERATED_FIELDS, validators
+
+EXAMPLE_EXPERIENCE = {
+    "title": "Software Developer",
+    "company": "A Cooler Company",
+    "start_date": "October 2022",
+    "end_date": "Present",
+    "description": "Writing JavaScript Code",
+    "logo": "example-logo.png"
+}
+
+
+def rebuilt_validation(payload):
+    '''
+    Required field check rebuilt on every call, without type checks
+    '''
+    required_fields = ['title', 'company', 'start_date', 'end_date', 'description', 'logo']
+    return [field for field in required_fields if field not in payload]
+
+
+def uncompiled_validation(payload, model=Experience):
+    '''
+    The same checks as the compiled validator, rebuilt from fields(model) on every call
+    '''
+    field_types = {model_field.name: model_field.type for model_field in fields(model)}
+    missing = (frozenset(field_types) - GENERATED_FIELDS) - payload.keys()
+    if missing:
+        return f"Missing required fields: {', '.join(sorted(missing))}"
+    unknown = payload.keys() - frozenset(field_types)
+    if unknown:
+        return f"Unknown fields: {', '.join(sorted(unknown))}"
+    for name, expected in field_types.items():
+        if name not in payload:
+            continue
+        value = payload[name]
+        is_bool = isinstance(value, bool) and expected is not bool
+        if is_bool or not isinstance(value, expected):
+            return f"Field '{name}' must be of type {expected.__name__}"
+    return None
+
+
+def main(number=200000):
+    '''
+    Print the average cost of each validation approach in microseconds
+    '''
+    compiled = validators['experience']
+    for name, func in (("rebuilt (required only)", rebuilt_validation),
+                       ("rebuilt (required, unknown, types)", uncompiled_validation),
+                       ("compiled (required, unknown, types)", compiled)):
+        seconds = min(timeit.repeat(lambda func=func: func(EXAMPLE_EXPERIENCE),
+                                    number=number, repeat=5))
+        print(f"{name}: {seconds / number * 1e6:.3f} us per request")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+'''
+Change feed for the Resume API. Every mutation is recorded with a
+monotonically increasing revision so clients can fetch only the diffs
+since the last revision they saw instead of re-downloading collections.
+
+Revisions only live as long as the process, so each feed has an epoch and
+clients refer to a point in the feed by the cursor "<epoch>-<revision>".
+'''
+
+import threading
+import uuid
+from collections import deque
+
+
+class ChangeFeed:
+    '''
+    Keeps a bounded, in-memory log of resume mutations
+    '''
+
+    def __init__(self, max_entries=1000):
+        self.epoch = uuid.uuid4().hex[:12]
+        self.revision = 0
+        self._entries = deque(maxlen=max_entries)
+        self._condition = threading.Condition()
+
+    def record(self, section, action, item_id, item=None):
+        '''
+        Record a mutation and return its revision number
+        '''
+        with self._condition:
+            self.revision += 1
+            self._entries.append({
+                "revision": self.revision,
+                "section": section,
+                "action": action,
+                "id": item_id,
+                "data": dict(item.__dict__) if item is not None else None
+            })
+            self._condition.notify_all()
+            return self.revision
+
+    def cursor(self, revision=None):
+        '''
+        Return the cursor for the given revision, or the current one
+        '''
+        return f"{self.epoch}-{self.revision if revision is None else revision}"
+
+    def parse_cursor(self, cursor):
+        '''
+        Return the revision of a cursor from this feed.
+        Returns None if the cursor is from another epoch, e.g. from
+        before a restart. Raises ValueError if the cursor is malformed.
+        '''
+        epoch, _, revision = cursor.rpartition('-')
+        if not epoch or not revision.isnumeric():
+            raise ValueError(f"Invalid cursor: {cursor}")
+        if epoch != self.epoch:
+            return None
+        return int(revision)
+
+    def retained(self):
+        '''
+        Return the current revision and all changes still in the log
+        '''
+        with self._condition:
+            return self.revision, list(self._entries)
+
+    def since(self, revision):
+        '''
+        Return the changes made after the given revision.
+        Returns None if the log no longer reaches back that far,
+        in which case the client has to re-fetch the collections.
+        '''
+        with self._condition:
+            return self._since(revision)
+
+    def wait(self, revision, timeout=None):
+        '''
+        Block until there are changes after the given revision or the
+        timeout expires, then return them (same contract as since)
+        '''
+        with self._condition:
+            self._condition.wait_for(lambda: self.revision != revision, timeout)
+            return self._since(revision)
+
+    def _since(self, revision):
+        if revision == self.revision:
+            return []
+        if revision is None or revision > self.revision:
+            return None
+        oldest = self._entries[0]["revision"] if self._entries else self.revision + 1
+        if revision < oldest - 1:
+            return None
+        return [entry for entry in self._entries if entry["revision"] > revision]
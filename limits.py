@@ -0,0 +1,87 @@
+'''
+Admission control for expensive endpoints. A per-client token bucket
+limits the request rate, and a bounded work queue sheds load once all
+workers are busy, so cheap routes keep their latency during spikes.
+'''
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class RateLimiter:
+    '''
+    Token bucket rate limiter, one bucket per client.
+    At most max_clients buckets are kept, the least recently used are dropped first.
+    '''
+
+    def __init__(self, rate, burst, max_clients=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, client):
+        '''
+        Take a token for the client.
+        Returns 0 if the request is allowed, otherwise the number of
+        seconds until the client has a token again.
+        '''
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if len(self._buckets) >= self.max_clients:
+                # a dropped client starts over with a full bucket
+                self._buckets.popitem(last=False)
+            if tokens >= 1:
+                self._buckets[client] = (tokens - 1, now)
+                return 0
+            self._buckets[client] = (tokens, now)
+            return (1 - tokens) / self.rate
+
+
+class WorkQueue:
+    '''
+    Bounded work queue: at most `workers` requests run at once and at most
+    `max_waiting` more wait for a slot, anything beyond that is shed
+    '''
+
+    def __init__(self, workers, max_waiting, timeout):
+        self.workers = workers
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self._running = 0
+        self._waiting = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        '''
+        Wait for a free worker slot.
+        Returns False if the queue is full or no slot freed up in time.
+        '''
+        with self._condition:
+            if self._running < self.workers:
+                self._running += 1
+                return True
+            if self._waiting >= self.max_waiting:
+                return False
+
+            self._waiting += 1
+            try:
+                if not self._condition.wait_for(lambda: self._running < self.workers,
+                                                self.timeout):
+                    return False
+            finally:
+                self._waiting -= 1
+            self._running += 1
+            return True
+
+    def release(self):
+        '''
+        Free the worker slot taken by acquire
+        '''
+        with self._condition:
+            self._running -= 1
+            self._condition.notify()
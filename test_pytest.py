@@ -1,10 +1,16 @@
 '''
 Tests in Pytest
 '''
-from app import app
+import time
 
+import pytest
+
+from app import app, load_limits, positive_limit
+
+from changes import ChangeFeed
+from limits import RateLimiter, WorkQueue
 from models import Skill
-from utils import load_data, correct_spelling
+from utils import load_data, correct_spelling, correct_spelling_until
 
 data = load_data('data/data.json')
 
@@ -352,4 +358,357 @@ def test_update_skill():
                 assert skill[key] == value
             found = True
             break
-    assert found, "Updated skill was not found in the returned list"
\ No newline at end of file
+    assert found, "Updated skill was not found in the returned list"
+
+def test_changes_since():
+    '''
+    Add a new skill and then get the changes since the previous revision.
+
+    Check that only the new skill is returned in the delta
+    '''
+    feed = app.test_client().get('/resume/changes').json
+    revision = feed['revision']
+    example_skill = {
+        "name": "Rust",
+        "proficiency": "1 year",
+        "logo": "example-logo.png"
+    }
+    item_id = app.test_client().post('/resume/skill', json=example_skill).json['id']
+
+    response = app.test_client().get(f'/resume/changes?since={feed["cursor"]}')
+    assert response.status_code == 200
+    assert response.json['revision'] == revision + 1
+    assert response.json['cursor'] == f"{feed['epoch']}-{revision + 1}"
+    assert len(response.json['changes']) == 1
+    change = response.json['changes'][0]
+    assert change['section'] == 'skill'
+    assert change['action'] == 'create'
+    assert change['id'] == item_id
+    assert change['data']['name'] == "Rust"
+
+    response = app.test_client().get(f'/resume/changes?since={response.json["cursor"]}')
+    assert response.json['changes'] == []
+
+    response = app.test_client().get(f'/resume/changes?since={feed["epoch"]}-{revision + 100}')
+    assert response.status_code == 410
+
+    response = app.test_client().get(f'/resume/changes?since={revision}')
+    assert response.status_code == 400
+
+
+def test_changes_other_epoch():
+    '''
+    Request the changes since a cursor from another epoch, e.g. before a restart.
+
+    Check that the client is told to re-fetch instead of getting a partial delta
+    '''
+    feed = app.test_client().get('/resume/changes').json
+    response = app.test_client().get(f'/resume/changes?since=0123456789ab-{feed["revision"]}')
+    assert response.status_code == 410
+    assert response.json['epoch'] == feed['epoch']
+
+
+def test_changes_stream():
+    '''
+    Add a new education and then read the change stream from the previous revision.
+
+    Check that the new education is sent as a server-sent event
+    '''
+    feed = app.test_client().get('/resume/changes').json
+    revision = feed['revision']
+    example_education = {
+        "course": "Physics",
+        "school": "MIT",
+        "start_date": "October 2020",
+        "end_date": "August 2022",
+        "grade": "90%",
+        "logo": "example-logo.png"
+    }
+    app.test_client().post('/resume/education', json=example_education)
+
+    response = app.test_client().get(f'/resume/changes/stream?since={feed["cursor"]}',
+                                     buffered=False)
+    assert response.mimetype == 'text/event-stream'
+    event = next(response.response).decode()
+    response.close()
+    assert event.startswith(f"id: {feed['epoch']}-{revision + 1}\nevent: change\n")
+    assert '"section": "education"' in event
+
+
+def test_post_skill_invalid_fields():
+    '''
+    POST requests to /resume/skill with an unknown field or a wrong type.
+
+    Check that both are rejected with a 400 instead of crashing the handler
+    '''
+    unknown_field_skill = {
+        "name": "Python",
+        "proficiency": "1 year",
+        "logo": "example-logo.png",
+        "level": "expert"
+    }
+    response = app.test_client().post('/resume/skill', json=unknown_field_skill)
+    assert response.status_code == 400
+    assert response.json['error'] == "Unknown fields: level"
+
+    wrong_type_skill = {
+        "name": "Python",
+        "proficiency": 5,
+        "logo": "example-logo.png"
+    }
+    response = app.test_client().post('/resume/skill', json=wrong_type_skill)
+    assert response.status_code == 400
+    assert response.json['error'] == "Field 'proficiency' must be of type str"
+
+
+def test_update_experience_missing_fields():
+    '''
+    PUT request to /resume/experience with missing fields.
+
+    Check that the update is rejected and the experience is unchanged
+    '''
+    prior_experience = app.test_client().get('/resume/experience?index=1').json
+    response = app.test_client().put('/resume/experience?index=1',
+                                     json={"title": "Roblox Developer"})
+    assert response.status_code == 400
+    assert prior_experience == app.test_client().get('/resume/experience?index=1').json
+
+
+def test_spelling_size_limits(monkeypatch):
+    '''
+    POST requests to /spelling/correct-spelling over each of the size limits.
+
+    Check that they are rejected before any spelling work is done
+    '''
+    monkeypatch.setattr('app.spelling_limiter', RateLimiter(rate=1, burst=10))
+    too_long = "a" * (app.config['SPELLING_MAX_TEXT_LENGTH'] + 1)
+    too_many_words = "speling " * (app.config['SPELLING_MAX_WORDS'] + 1)
+    word_too_long = "a" * (app.config['SPELLING_MAX_WORD_LENGTH'] + 1)
+    for text, error in ((too_long, "Text too long"),
+                        (too_many_words, "Too many words"),
+                        (word_too_long, "Word too long")):
+        response = app.test_client().post('/spelling/correct-spelling', json={"text": text})
+        assert response.status_code == 413
+        assert response.json['error'] == error
+
+
+def test_spelling_rate_limited(monkeypatch):
+    '''
+    POST two requests to /spelling/correct-spelling with a burst of one.
+
+    Check that the second one gets a 429 with a Retry-After header
+    '''
+    monkeypatch.setattr('app.spelling_limiter', RateLimiter(rate=0.5, burst=1))
+    response = app.test_client().post('/spelling/correct-spelling', json={"text": "hello"})
+    assert response.status_code == 200
+    response = app.test_client().post('/spelling/correct-spelling', json={"text": "hello"})
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == "2"
+
+
+def test_spelling_load_shedding(monkeypatch):
+    '''
+    POST a request to /spelling/correct-spelling while the only worker is busy.
+
+    Check that it is shed with a 503 and a Retry-After header
+    '''
+    queue = WorkQueue(workers=1, max_waiting=0, timeout=0)
+    assert queue.acquire()
+    monkeypatch.setattr('app.spelling_limiter', RateLimiter(rate=1, burst=10))
+    monkeypatch.setattr('app.spelling_queue', queue)
+    monkeypatch.setitem(app.config, 'SPELLING_TIME_BUDGET', 3)
+    response = app.test_client().post('/spelling/correct-spelling', json={"text": "hello"})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == "3"
+
+
+def test_spelling_time_budget(monkeypatch):
+    '''
+    POST a misspelled text with and without time budget left.
+
+    Check that the response says whether the correction was cut short
+    '''
+    monkeypatch.setattr('app.spelling_limiter', RateLimiter(rate=1, burst=10))
+    response = app.test_client().post('/spelling/correct-spelling',
+                                      json={"text": "the speling"})
+    assert response.json == {"before": "the speling", "after": "the spelling",
+                             "truncated": False}
+
+    monkeypatch.setitem(app.config, 'SPELLING_TIME_BUDGET', 0)
+    response = app.test_client().post('/spelling/correct-spelling',
+                                      json={"text": "the speling"})
+    assert response.status_code == 200
+    assert response.json == {"before": "the speling", "after": "the speling",
+                             "truncated": True}
+
+
+def test_correct_spelling_until_deadline():
+    '''
+    Test the correct_spelling_until function with a deadline that has passed
+
+    Check that misspelled words are left as is and reported as truncated
+    '''
+    deadline = time.monotonic() - 1
+    assert correct_spelling_until("speling is hard", deadline) == ("speling is hard", True)
+    assert correct_spelling_until("spelling is hard", deadline) == ("spelling is hard", False)
+    assert correct_spelling_until("speling wrongg", time.monotonic() + 60, long_word_length=5) \
+        == ("spelling wrong", False)
+
+
+def test_correct_spelling_no_candidates():
+    '''
+    Test the correct_spelling function with a word that has no correction
+
+    Check that the word is kept as it is
+    '''
+    assert correct_spelling("qwertyuiopasdfghjklz") == "qwertyuiopasdfghjklz"
+    assert correct_spelling("zqxjv speling") == "zqxjv spelling"
+
+
+def test_spelling_rate_limiter():
+    '''
+    Take all the tokens of one client.
+
+    Check that the next request has to wait while other clients are unaffected
+    '''
+    limiter = RateLimiter(rate=1, burst=2)
+    assert limiter.acquire("client-a") == 0
+    assert limiter.acquire("client-a") == 0
+    assert limiter.acquire("client-a") > 0
+    assert limiter.acquire("client-b") == 0
+
+
+def test_spelling_work_queue_sheds_load():
+    '''
+    Fill the only worker slot of a queue with no waiting room.
+
+    Check that the next request is shed until the slot is released
+    '''
+    queue = WorkQueue(workers=1, max_waiting=0, timeout=0)
+    assert queue.acquire()
+    assert not queue.acquire()
+    queue.release()
+    assert queue.acquire()
+
+
+def test_changes_delete_then_update():
+    '''
+    Delete an experience and then update the experience now at that index.
+
+    Check that the delta identifies both changes by the stored ids
+    '''
+    example_experience = {
+        "title": "Software Developer",
+        "company": "A Cooler Company",
+        "start_date": "October 2022",
+        "end_date": "Present",
+        "description": "Writing JavaScript Code",
+        "logo": "example-logo.png"
+    }
+    first_id = app.test_client().post('/resume/experience', json=example_experience).json['id']
+    second_id = app.test_client().post('/resume/experience', json=example_experience).json['id']
+    experiences = app.test_client().get('/resume/experience').json
+    # ids in data.json are 1 indexed
+    index = [experience['id'] for experience in experiences].index(first_id) + 1
+    feed = app.test_client().get('/resume/changes').json
+
+    app.test_client().delete(f'/resume/experience?index={index}')
+    updated_experience = dict(example_experience, title="Roblox Developer")
+    response = app.test_client().put(f'/resume/experience?index={index}',
+                                     json=updated_experience)
+    assert response.json['id'] == second_id
+
+    delta = app.test_client().get(f'/resume/changes?since={feed["cursor"]}').json['changes']
+    assert [(change['action'], change['id']) for change in delta] == \
+        [('delete', first_id), ('update', second_id)]
+    assert delta[1]['data']['id'] == second_id
+
+
+def test_post_skill_bool_id():
+    '''
+    POST request to /resume/skill with a boolean id.
+
+    Check that a bool is not accepted where an int is expected
+    '''
+    bool_id_skill = {
+        "id": True,
+        "name": "Python",
+        "proficiency": "1 year",
+        "logo": "example-logo.png"
+    }
+    response = app.test_client().post('/resume/skill', json=bool_id_skill)
+    assert response.status_code == 400
+    assert response.json['error'] == "Field 'id' must be of type int"
+
+
+def test_changes_without_cursor_after_overflow(monkeypatch):
+    '''
+    Record more changes than a small feed keeps and get the changes without a cursor.
+
+    Check that the changes still in the log are returned instead of a 410
+    '''
+    feed = ChangeFeed(max_entries=3)
+    for item_id in range(1, 6):
+        feed.record('skill', 'create', item_id, Skill(id=item_id))
+    monkeypatch.setattr('app.changes', feed)
+
+    response = app.test_client().get('/resume/changes')
+    assert response.status_code == 200
+    assert [change['id'] for change in response.json['changes']] == [3, 4, 5]
+    assert response.json['cursor'] == feed.cursor(5)
+
+
+def test_changes_stream_limits(monkeypatch):
+    '''
+    Open change streams with a single stream slot and no stream lifetime.
+
+    Check that a second stream is refused while the first is open
+    and that the slot is freed once the stream has ended
+    '''
+    monkeypatch.setattr('app.change_streams', WorkQueue(workers=1, max_waiting=0, timeout=0))
+    monkeypatch.setitem(app.config, 'CHANGES_STREAM_LIFETIME', 0)
+
+    first = app.test_client().get('/resume/changes/stream', buffered=False)
+    assert first.status_code == 200
+    second = app.test_client().get('/resume/changes/stream', buffered=False)
+    assert second.status_code == 503
+    assert 'Retry-After' in second.headers
+
+    assert list(first.response) == []
+    first.close()
+    third = app.test_client().get('/resume/changes/stream')
+    assert third.status_code == 200
+
+
+def test_spelling_rate_limiter_max_clients():
+    '''
+    Take tokens for more clients than the limiter keeps buckets for.
+
+    Check that the number of buckets stays bounded and the least recently used is dropped
+    '''
+    limiter = RateLimiter(rate=0.001, burst=1, max_clients=2)
+    assert limiter.acquire("client-a") == 0
+    assert limiter.acquire("client-b") == 0
+    assert limiter.acquire("client-a") > 0
+    assert limiter.acquire("client-c") == 0
+
+    # client-b was the least recently used, so it starts over with a full bucket
+    assert limiter.acquire("client-b") == 0
+    assert limiter.acquire("client-c") > 0
+
+
+def test_limits_from_environment(monkeypatch):
+    '''
+    Override limits with FLASK_<NAME> environment variables.
+
+    Check that only the limits are loaded and that a rate of 0 is rejected
+    '''
+    monkeypatch.setenv('FLASK_SPELLING_RATE', '0')
+    monkeypatch.setenv('FLASK_ENV', 'development')
+    config = {'SPELLING_RATE': 2, 'SPELLING_BURST': 10}
+    load_limits(config)
+    assert config == {'SPELLING_RATE': 0, 'SPELLING_BURST': 10}
+
+    assert positive_limit(config, 'SPELLING_BURST') == 10
+    with pytest.raises(ValueError):
+        positive_limit(config, 'SPELLING_RATE')
@@ -1,9 +1,13 @@
 import json
+import time
 
 from spellchecker import SpellChecker
 
 from models import Experience, Education, Skill
 
+# loading the dictionary is slow, so it is shared by all requests
+spell = SpellChecker()
+
 def load_data(filename):
     """
     Using dataclasses to serialize and deserialize JSON data, this forms a "layer" between the data and the application.
@@ -47,15 +51,36 @@ def generate_id(data, model):
         return max(item.id for item in data[model] if item.id is not None) + 1
     return 1
 
-def correct_spelling(text):
-    '''Corrects the spelling of the given text'''
-    spell = SpellChecker()
-    words = text.split()
+def correct_word(word, long_word_length=6):
+    '''
+    Corrects the spelling of a single word, or returns it as is if there is no correction.
+    The edit distance 2 search grows quickly with word length,
+    so words longer than long_word_length are only corrected up to an edit distance of 1.
+    '''
+    if word in spell:
+        return word
+    if len(word) > long_word_length:
+        candidates = spell.known(spell.edit_distance_1(word))
+        return max(candidates, key=spell.word_usage_frequency) if candidates else word
+    # correction returns None if there is no candidate
+    return spell.correction(word) or word
+
+def correct_spelling_until(text, deadline, long_word_length=6):
+    '''
+    Corrects the spelling of the given text until the deadline (a time.monotonic() value).
+    Returns the corrected text and whether misspelled words were left as is
+    because the deadline had passed.
+    '''
     corrected_words = []
-    for word in words:
-        if word not in spell:
-            correct_word = spell.correction(word)
-            corrected_words.append(correct_word)
-        else:
+    truncated = False
+    for word in text.split():
+        if word not in spell and time.monotonic() >= deadline:
+            truncated = True
             corrected_words.append(word)
-    return ' '.join(corrected_words)
\ No newline at end of file
+        else:
+            corrected_words.append(correct_word(word, long_word_length))
+    return ' '.join(corrected_words), truncated
+
+def correct_spelling(text):
+    '''Corrects the spelling of the given text'''
+    return ' '.join(correct_word(word) for word in text.split())
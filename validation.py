@@ -0,0 +1,56 @@
+'''
+Request validation for the Resume API. A validator is compiled once per
+model so the field lookups are not rebuilt on every request.
+'''
+
+from dataclasses import fields
+
+from models import Experience, Education, Skill
+
+# ids are assigned by the server, so they are never required from the client
+GENERATED_FIELDS = frozenset({'id'})
+
+
+def compile_validator(model):
+    '''
+    Build a validator for the given dataclass.
+
+    The validator takes the request payload and returns an error message,
+    or None if the payload can be used to create the model.
+    '''
+    field_types = {model_field.name: model_field.type for model_field in fields(model)}
+    required = frozenset(field_types) - GENERATED_FIELDS
+    known = frozenset(field_types)
+    checks = tuple(field_types.items())
+
+    def validate(payload):
+        if not isinstance(payload, dict):
+            return 'Request body must be a JSON object'
+
+        keys = payload.keys()
+        missing = required - keys
+        if missing:
+            return f"Missing required fields: {', '.join(sorted(missing))}"
+
+        unknown = keys - known
+        if unknown:
+            return f"Unknown fields: {', '.join(sorted(unknown))}"
+
+        for name, expected in checks:
+            if name not in payload:
+                continue
+            value = payload[name]
+            # bool is a subclass of int, but True is not a valid id
+            is_bool = isinstance(value, bool) and expected is not bool
+            if is_bool or not isinstance(value, expected):
+                return f"Field '{name}' must be of type {expected.__name__}"
+        return None
+
+    return validate
+
+
+validators = {
+    'experience': compile_validator(Experience),
+    'education': compile_validator(Education),
+    'skill': compile_validator(Skill)
+}